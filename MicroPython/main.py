@@ -1,10 +1,15 @@
 # Using firmware rp2-pico-20230414-unstable-v1.19.1-1016-gb525f1c9e.uf2 
+import machine
 from machine import Pin, I2C, ADC
 import utime
 import math
 import _thread
+import uasyncio
+import rp2
 import micropython
+from micropython import const
 import gc
+from array import array
 gc.enable()
 # SSD1306 OLED display, install the following modules from PyPI:
 # micropython-ssd1306 v0.3 by Stefan Lehmann
@@ -16,24 +21,26 @@ from oled.fonts import ubuntu_mono_20, ubuntu_mono_15, ubuntu_condensed_12
 ####################################
 # Variables that need calibration #
 ####################################
-action_after_seconds        = micropython.const(600)    # seconds to wait after presence is no longer detected to close the lid or revert to AUTO mode
-action_revolutions          = micropython.const(17)     # stepper motor rotations required to close the toilet lid
-brightness_threshold        = micropython.const(10)     # phototransistor brightness (%) threshold for detecting restroom light
-motion_threshold            = micropython.const(5)      # difference in distance (cm) between successive measurements to detect motion 
-oled_dim                    = micropython.const(100)    # value between 0 (dimmest) and 255 (brightest) to dim the oled display
-polling_interval_debug      = micropython.const(0.25)   # seconds between polling (and screen refresh) when in DEBUG mode
-polling_interval_presence   = micropython.const(1)      # seconds between polling when presence has been detected
-polling_interval_standby    = micropython.const(5)      # seconds between polling during standby
-previous_distance           = micropython.const(50)     # initialise typical distance (cm) measured when nobody is in the restroom
-step_sleep_close            = micropython.const(0.0025) # seconds between stepper motor steps during lid close action
-step_sleep_retract          = micropython.const(0.002)  # seconds between stepper motor steps during retract action
+_ACTION_AFTER_SECONDS       = const(600) # seconds to wait after presence is no longer detected to close the lid or revert to AUTO mode
+_ACTION_REVOLUTIONS         = const(17)  # stepper motor rotations required to close the toilet lid
+_BRIGHTNESS_THRESHOLD       = const(10)  # phototransistor brightness (%) threshold for detecting restroom light
+_MOTION_THRESHOLD           = const(5)   # difference in distance (cm) between a measurement and the average distance to detect motion 
+_MOTION_POLLS               = const(2)   # successive polls that must detect motion before it counts as presence
+_OLED_DIM                   = const(100) # value between 0 (dimmest) and 255 (brightest) to dim the oled display
+polling_interval_debug      = 0.25       # seconds between polling (and screen refresh) when in DEBUG mode
+_POLLING_INTERVAL_PRESENCE  = const(1)   # seconds between polling when presence has been detected
+_POLLING_INTERVAL_STANDBY   = const(5)   # seconds between polling during standby
+_INITIAL_DISTANCE           = const(50)  # initialise typical distance (cm) measured when nobody is in the restroom
+step_sleep_close            = 0.0025     # seconds between stepper motor steps during lid close action
+step_sleep_retract          = 0.002      # seconds between stepper motor steps during retract action
 # 3S battery produces 12.6V when fully charged. Voltage divider equation: Vout = Vin * R2 / (R1 + R2)
 # R1 = 680KOhm, R2 = 220KOhm, so 12.6Vin give 3.08Vout
 # read_u16() returns a 16bit unsigned integer (between 0 and 65535, at 0V and 3.3V respectively)
 # original voltage Vin = read_u16() * 12.6/65535 * 3.3/3.08
 # another way to calculate original voltage = read_u16() * 3.3/65535 * (R1 + R2)/R2
-voltage_conversion_factor   = micropython.const(3.3/65535 * (680+220)/220)
-voltage_correction_factor   = micropython.const(0.50)   # my maths is flawless but my hardware is not; set this to zero, hook everything up, measure voltage with a multimeter and with the ADC (example: 11.97 and 11.47), the difference is the correction factor
+voltage_conversion_factor   = 3.3/65535 * (680+220)/220
+voltage_correction_factor   = 0.50       # my maths is flawless but my hardware is not; set this to zero, hook everything up, measure voltage with a multimeter and with the ADC (example: 11.97 and 11.47), the difference is the correction factor
+_DEBUG                      = const(0)   # set to 1 to print sensor readings, with 0 the compiler leaves the prints out entirely
 
 ###################
 #   Define pins   #
@@ -48,6 +55,9 @@ pin_ky040_sw        = Pin(10, Pin.IN, Pin.PULL_DOWN)
 # HC-SR04 ultrasonic distance sensor
 pin_hcsr04_trigger  = Pin(14, Pin.OUT)
 pin_hcsr04_echo     = Pin(15, Pin.IN)
+_HCSR04_TIMEOUT_US  = const(30000) # stop counting the echo after 30ms (about 5m round trip), nothing is in range
+hcsr04_max_distance = 514.5        # distance (cm) reported when the echo times out, 30000us * 0.01715
+_HCSR04_CYCLE_MS    = const(60)    # minimum time between pings, the echo can stay high for 38ms without a target
 # SFH 300 phototransistor
 pin_sfh300_adc      = ADC(26)
 # 3S LiPo battery
@@ -67,25 +77,79 @@ pin_motor_4         = Pin(22, Pin.OUT)
 # MANUAL:   immediately close the lid, ignoring presence detection
 # DEBUG:    manually adjust position, and display sensor output. Useful for calibration
 action_in_progress  = False # true if the motor is being actuated
-motor_cancel        = False # used to stop the motor if action is in progress
-mode_debug          = False # true if DEBUG mode is engaged
-mode_manual         = False # true if MAUNAL mode is engaged
-mode_switch         = False # used in the main function to break out of loops
+motor_cancel        = array('B', [0]) # set to 1 to stop the motor if action is in progress
+_MODE_AUTO          = const(0)
+_MODE_MANUAL        = const(1)
+_MODE_DEBUG         = const(2)
+mode                = _MODE_AUTO # currently engaged mode, the button advances it by one
+mode_switch_flag    = uasyncio.ThreadSafeFlag() # set when the mode changes, main() then cancels the running mode task
 
 
 ######################
 #   Setup the OLED   #
 ######################
-oled_width = micropython.const(128)
-oled_height = micropython.const(64)
+_OLED_WIDTH = const(128)
+_OLED_HEIGHT = const(64)
 # the first argument of I2C is the set of i2c pins which should be initialised
 i2c=I2C(0, scl=pin_oled_scl, sda=pin_oled_sda, freq=400000)
-oled = SSD1306_I2C(oled_width, oled_height, i2c)
-oled.contrast(oled_dim)
+
+# Compare the framebuffer with what was last sent, copy over the changes and return a bit mask of the changed pages
+@micropython.viper
+def oled_dirty_pages(buffer: ptr8, shadow: ptr8, pages: int, width: int) -> int:
+    dirty = 0
+    i = 0
+    for page in range(pages):
+        for x in range(width):
+            if buffer[i] != shadow[i]:
+                shadow[i] = buffer[i]
+                dirty |= 1 << page
+            i += 1
+    return dirty
+
+# show() only sends the pages (8 pixel rows) that changed, and nothing at all if the frame is unchanged
+class ssd1306_partial_show(SSD1306_I2C):
+    shadow = None # copy of the display RAM
+    def show(self):
+        if self.shadow is None: # first call from init_display()
+            super().show()
+            self.shadow = bytearray(self.buffer)
+            return
+        dirty = oled_dirty_pages(self.buffer, self.shadow, self.pages, self.width)
+        if not dirty:
+            return
+        first_page = 0
+        while not (dirty >> first_page) & 1:
+            first_page += 1
+        last_page = self.pages - 1
+        while not (dirty >> last_page) & 1:
+            last_page -= 1
+        self.write_cmd(0x21) # set column address
+        self.write_cmd(0)
+        self.write_cmd(self.width - 1)
+        self.write_cmd(0x22) # set page address
+        self.write_cmd(first_page)
+        self.write_cmd(last_page)
+        self.write_data(memoryview(self.buffer)[first_page * self.width:(last_page + 1) * self.width])
+
+oled = ssd1306_partial_show(_OLED_WIDTH, _OLED_HEIGHT, i2c)
+oled.contrast(_OLED_DIM)
 # fonts
 write12 = Write(oled, ubuntu_condensed_12)
-write15 = Write(oled, ubuntu_mono_15)
-write20 = Write(oled, ubuntu_mono_20)
+
+# Render a constant string once into its own framebuffer, so it can be blit() instead of drawn pixel by pixel
+def prerender(font, string, color=1, bgcolor=0):
+    width = sum(font._FONT[ord(c)][0] for c in string)
+    height = len(font._FONT[ord(string[0])]) - 1
+    label = framebuf.FrameBuffer(bytearray(width * ((height + 7) // 8)), width, height, framebuf.MONO_VLSB)
+    Write(label, font).text(string, 0, 0, color=color, bgcolor=bgcolor)
+    return label
+label_welcome_to    = prerender(ubuntu_mono_20, "Welcome to")
+label_the_restroom  = prerender(ubuntu_mono_20, "the restroom")
+label_manual_mode   = prerender(ubuntu_mono_15, "MANUAL mode")
+label_debug_mode    = prerender(ubuntu_mono_15, "DEBUG mode")
+label_extending     = prerender(ubuntu_condensed_12, "Extending", color=0, bgcolor=1)
+label_retracting    = prerender(ubuntu_condensed_12, "Retracting", color=0, bgcolor=1)
+label_motor_off     = prerender(ubuntu_condensed_12, "Motor off")
 
 # Battery icons
 class battery_status:
@@ -116,17 +180,64 @@ arrows = Write(oled, horizontal_arrows_icon)
 toilet_icon_array = bytearray(b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xe0\x00\x00\x00\x00\x00\x00\xa0\x00\x00\x00\x00\x00\x07\xfc\x00\x00\x00\x00\x00\x0c\x06\x00\x00\x00\x00\x00\x18\x02\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\x00\x00\x00\x00\x00\x10\x01\xff\xff\xf8\x00\x00\x10\x01\x80\x00\x04\x00\x00\x1f\xff\xff\xff\xfc\x00\x00\x10\x00\x00\x00\x04\x00\x00\x10\x00\x00\x00\x04\x00\x00\x10\x00\x00\x00\x04\x00\x00\x08\x00\x00\x00\x08\x00\x00\x08\x00\x00\x00\x10\x00\x00\x04\x00\x00\x00`\x00\x00\x06\x00\x00\x01\x80\x00\x00\x02\x00\x00\x03\x00\x00\x00\x01\x00\x00\x04\x00\x00\x00\x00\x80\x00\x08\x00\x00\x00\x00@\x00\x18\x00\x00\x00\x00@\x00\x10\x00\x00\x00\x00 \x00\x10\x00\x00\x00\x00 \x00 \x00\x00\x00\x00 \x00 \x00\x00\x00\x00 \x00 \x00\x00\x00\x00`\x00 \x00\x00\x00\x00@\x00 \x00\x00\x00\x00@\x00\x10\x00\x00\x00\x00\xc0\x00\x10\x00\x00\x00\x00\x80\x00\x08\x00\x00\x00\x00\x80\x00\x08\x00\x00\x00\x00\xff\xff\xf0\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00')
 toilet_icon = framebuf.FrameBuffer(toilet_icon_array, 55, 55, framebuf.MONO_HLSB)
 
+#################################
+# Setup the HC-SR04 PIO program #
+#################################
+# Runs at 2MHz so the two instruction wait and echo loops decrement their counter once per microsecond
+@rp2.asm_pio(set_init=rp2.PIO.OUT_LOW)
+def hcsr04_pio():
+    pull()                  # timeout (us) from measure_distance
+    mov(x, osr)             # counts down while the echo is high
+    mov(y, osr)             # counts down while waiting for the echo to start
+    set(pins, 1) [19]       # 10us trigger pulse
+    set(pins, 0)
+    label("rise")
+    jmp(pin, "echo")        # the echo has started
+    jmp(y_dec, "rise")
+    mov(x, y)               # no echo at all (sensor missing?), y wrapped to 0xffffffff
+    jmp("done")
+    label("echo")
+    jmp(pin, "count")       # echo is still high
+    jmp("done")
+    label("count")
+    jmp(x_dec, "echo")
+    label("done")
+    mov(isr, x)             # remaining count, wraps to 0xffffffff on timeout
+    push()
+hcsr04_sm = rp2.StateMachine(0, hcsr04_pio, freq=2000000, set_base=pin_hcsr04_trigger, jmp_pin=pin_hcsr04_echo)
+hcsr04_sm.active(1)
+
 ###########################
 # Setup the stepper motor #
 ###########################
-steps_per_revolution = micropython.const(2048)      # stepper motor steps per revolution
+_STEPS_PER_REVOLUTION = const(2048)      # stepper motor steps per revolution
 motor_direction=True # True for clockwise (closing seat), False for counter-clockwise (retracting arm) (as seen when looking from the back of the motor)
 motor_retract_revolutions = 0 # If the action is interrupted, reverse the motor by this amount of revolutions
 step_sequence = [[1,0,0,0],
                  [0,1,0,0],
                  [0,0,1,0],
                  [0,0,0,1]]
-motor_pins = [pin_motor_1, pin_motor_2, pin_motor_3, pin_motor_4]
+motor_gpios = (18, 19, 20, 22) # GPIO numbers of pin_motor_1 to pin_motor_4
+# pack each step of step_sequence into a bit mask of the PIO out pins (GPIO18-22), e.g. [0,0,0,1] is 1 << 4
+step_lut_ccw = array('I', [sum(bit << (gpio - motor_gpios[0]) for bit, gpio in zip(step, motor_gpios)) for step in step_sequence])
+del step_sequence # only the lookup tables are used from here on
+# clockwise walks the sequence backwards, stored reversed so both directions step forwards through their table
+step_lut_cw = array('I', [step_lut_ccw[-i] for i in range(4)])
+# The state machine takes one word per step: pin pattern in bits 0-4, delay until the next step (us) in bits 5-31
+# GPIO21 sits in the middle of the out pins but is left as an input, since it is broken
+_STEPPER_OVERHEAD_US = const(4) # pull, two outs and the last jmp of each step
+@rp2.asm_pio(out_init=(rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW, rp2.PIO.OUT_LOW, rp2.PIO.IN_LOW, rp2.PIO.OUT_LOW), out_shiftdir=rp2.PIO.SHIFT_RIGHT)
+def stepper_pio():
+    pull()
+    out(pins, 5)
+    out(y, 27)
+    label("delay")
+    jmp(y_dec, "delay")
+stepper_sm = rp2.StateMachine(1, stepper_pio, freq=1000000, out_base=pin_motor_1)
+stepper_sm.active(1)
+motor_off_instr = rp2.asm_pio_encode("mov(pins, null)", 0) # encoded once, exec() of a string would compile it on every call
+_PIO0_FDEBUG     = const(0x50200008)     # PIO0 FDEBUG register
+_STEPPER_TXSTALL = const(1 << (24 + 1)) # FDEBUG.TXSTALL bit of state machine 1, set while it waits on an empty FIFO
 
 ############################
 # Setup the rotary encoder #
@@ -134,16 +245,18 @@ motor_pins = [pin_motor_1, pin_motor_2, pin_motor_3, pin_motor_4]
 last_button_time    = 0 # last time the button was pushed
 rotary_counter      = 0 # position of the knob, 20 steps per 360 degrees
 last_rotation_time  = 0 # last time either dt or clk interrupt occured
-deadzone            = micropython.const(math.radians(40))   # rotation deadzone, 18 degrees per step, so 40 degrees is about two steps in either direction
-max_rotation_steps  = micropython.const(10)                 # limit how many steps in either direction can be made, 10 steps is half a rotation
+rotary_step_angle   = 2 * math.pi / 20 # radians per step of the knob
+deadzone            = math.radians(40) # rotation deadzone, 18 degrees per step, so 40 degrees is about two steps in either direction
+_MAX_ROTATION_STEPS = const(10)        # limit how many steps in either direction can be made, 10 steps is half a rotation
 
 #################
 #   Functions   #
 #################
 
+@micropython.native
 def button_interrupt(pin):
     irq_state = machine.disable_irq()
-    global motor_cancel, last_button_time, mode_debug, mode_manual, mode_switch
+    global last_button_time, mode
     # <debounce>
     new_button_time = utime.ticks_ms()
     if utime.ticks_diff(new_button_time, last_button_time) < 200:
@@ -152,36 +265,17 @@ def button_interrupt(pin):
     else:
         last_button_time = new_button_time
     # </debounce>
-    motor_cancel = True
-    # switch from AUTO to MANUAL
-    if not mode_debug and not mode_manual:
-        mode_manual = True
-        mode_switch = True
-    # switch from MANUAL to DEBUG
-    elif not mode_debug and mode_manual:
-        mode_debug = True
-        mode_manual = False
-        mode_switch = True
-    # switch from DEBUG to AUTO
-    elif mode_debug and not mode_manual:
-        mode_debug = False
-        mode_switch = True
-    # Defensive programming
-    else:
-        motor_cleanup()
-        oled.fill(0)
-        write12.text("State machine error", 0, 0)
-        oled.show()
-        print("State machine error")
-        machine.enable_irq(irq_state)
-        exit(1)
+    motor_cancel[0] = 1
+    # AUTO -> MANUAL -> DEBUG -> AUTO
+    mode = (mode + 1) % 3
+    mode_switch_flag.set() # safe to call from a hard interrupt, wakes the scheduler immediately
     machine.enable_irq(irq_state)
 
 def clk_interrupt(pin):
     irq_state = machine.disable_irq()
-    global motor_cancel, last_rotation_time, rotary_counter
+    global last_rotation_time, rotary_counter
     # only do something in DEBUG mode
-    if not mode_debug:
+    if mode != _MODE_DEBUG:
         machine.enable_irq(irq_state)
         return
     # debounce
@@ -193,10 +287,10 @@ def clk_interrupt(pin):
         last_rotation_time = new_rotation_time
     # immediately stop motor if retraction is in progress during debug mode
     if action_in_progress:
-        motor_cancel = True
+        motor_cancel[0] = 1
     # don't register more than half a rotation
-    if rotary_counter >= max_rotation_steps:
-        rotary_counter = max_rotation_steps
+    if rotary_counter >= _MAX_ROTATION_STEPS:
+        rotary_counter = _MAX_ROTATION_STEPS
         machine.enable_irq(irq_state)
         return
     # Increment counter
@@ -208,9 +302,9 @@ def clk_interrupt(pin):
 
 def dt_interrupt(pin):
     irq_state = machine.disable_irq()
-    global motor_cancel, last_rotation_time, rotary_counter
+    global last_rotation_time, rotary_counter
     # only do something in DEBUG mode
-    if not mode_debug:
+    if mode != _MODE_DEBUG:
         machine.enable_irq(irq_state)
         return
     # <debounce>
@@ -222,10 +316,10 @@ def dt_interrupt(pin):
         last_rotation_time = new_rotation_time
     # immediately stop motor if retraction is in progress during debug mode
     if action_in_progress:
-        motor_cancel = True
+        motor_cancel[0] = 1
     # don't register more than half a rotation
-    if rotary_counter <= -max_rotation_steps:
-        rotary_counter = -max_rotation_steps
+    if rotary_counter <= -_MAX_ROTATION_STEPS:
+        rotary_counter = -_MAX_ROTATION_STEPS
         machine.enable_irq(irq_state)
         return
     # Increment counter
@@ -239,31 +333,57 @@ def clear_screen():
     oled.fill(0)
     oled.show()
 
+# bit 0: brightness is above its threshold, bit 1: the distance moved by more than the motion threshold
+@micropython.viper
+def presence_flags(brightness: int, distance: int, baseline: int, brightness_limit: int, motion_limit: int) -> int:
+    d = distance - baseline
+    sign = d >> 31          # 0 if d is positive, -1 if negative
+    d = (d ^ sign) - sign   # branchless abs(d)
+    return int(brightness > brightness_limit) | (int(d > motion_limit) << 1)
+
+# exponentially weighted moving average with alpha = 1/8
+@micropython.viper
+def ewma_update(average: int, sample: int) -> int:
+    return average - (average >> 3) + (sample >> 3)
+
+motion_count = 0 # successive polls that detected motion
+distance_baseline = _INITIAL_DISTANCE << 4 # average distance (cm * 16) while nothing moves
+last_brightness = 0 # readings of the last poll, shown by draw_status_bar() without measuring again
+last_distance = _INITIAL_DISTANCE
 def detect_presence():
-    global previous_distance
-    brightness_detected = False
-    motion_detected = False
-    presence_detected = False
-    brightness = measure_brightness()
-    if brightness > brightness_threshold:
-        brightness_detected = True
-    distance = measure_distance()
-    if distance > previous_distance + motion_threshold or distance < previous_distance - motion_threshold:
-        motion_detected = True
-    if brightness_detected or motion_detected:
-        presence_detected = True
-    previous_distance = distance
-    #print("Presence detected: ", presence_detected)
-    #print("The distance from object is ", distance, "cm")
-    #print("The brightness is ", brightness)
+    global motion_count, distance_baseline, last_brightness, last_distance
+    brightness = last_brightness = measure_brightness()
+    distance = last_distance = measure_distance()
+    distance_fixed = int(distance * 16) # cm * 16, keeps a fraction through the integer average
+    # both readings in 1/16 units, so the fractions survive the integer comparison
+    flags = presence_flags(int(brightness * 16), distance_fixed, distance_baseline, _BRIGHTNESS_THRESHOLD << 4, _MOTION_THRESHOLD << 4)
+    if flags & 2:
+        motion_count += 1
+        # once motion is confirmed, follow the new distance so a moved object can't keep presence detected forever
+        if motion_count >= _MOTION_POLLS:
+            distance_baseline = distance_fixed
+    else:
+        motion_count = 0
+        distance_baseline = ewma_update(distance_baseline, distance_fixed)
+    presence_detected = bool(flags & 1) or motion_count >= _MOTION_POLLS
+    if _DEBUG:
+        print("Presence detected: ", presence_detected)
+        print("The distance from object is ", distance, "cm")
+        print("The brightness is ", brightness)
     return presence_detected
 
+rotary_encoder_drawn = None # (rotary_counter, action_in_progress) currently on the screen, None after the screen is cleared
 def draw_rotary_encoder(rotary_counter):
+    global rotary_encoder_drawn
+    # DEBUG mode calls this on every poll, only redraw when the dial or the motor state changed
+    if rotary_encoder_drawn == (rotary_counter, action_in_progress):
+        return
+    rotary_encoder_drawn = (rotary_counter, action_in_progress)
     circle_radius = 20
     centre_x = 100
     centre_y = 39
     oled.fill_rect(80, 13, 128, 64, 0)
-    angle = rotary_counter * micropython.const(2 * math.pi / 20)
+    angle = rotary_counter * rotary_step_angle
     # draw the circle
     oled.ellipse(centre_x, centre_y, circle_radius, circle_radius, 1)
     # draw the deadzone
@@ -291,7 +411,7 @@ def draw_rotary_encoder(rotary_counter):
             oled.line(inner_x, inner_y, outer_x, outer_y, 1)
         oled.fill_rect(0, 48, 75, 64, 0)
         oled.fill_rect(10, 48, 60, 16, 1)
-        write12.text("Extending", 20, 49, bgcolor=1, color=0)
+        oled.blit(label_extending, 20, 49)
     elif angle < -deadzone:
         deadzone_deg = round(math.degrees(deadzone))
         angle_deg = round(math.degrees(angle))
@@ -304,29 +424,27 @@ def draw_rotary_encoder(rotary_counter):
             oled.line(inner_x, inner_y, outer_x, outer_y, 1)
         oled.fill_rect(0, 48, 75, 64, 0)
         oled.fill_rect(10, 48, 60, 16, 1)
-        write12.text("Retracting", 18, 49, bgcolor=1, color=0)
+        oled.blit(label_retracting, 18, 49)
     else:
         if action_in_progress: # automatic retract when switching from MANUAL mode to DEBUG mode should show "Retracting"
             oled.fill_rect(0, 48, 75, 64, 0)
             oled.fill_rect(10, 48, 60, 16, 1)
-            write12.text("Retracting", 18, 49, bgcolor=1, color=0)
+            oled.blit(label_retracting, 18, 49)
         else:
             oled.fill_rect(0, 48, 75, 64, 0)
             oled.rect(10, 48, 60, 16, 1)
-            write12.text("Motor off", 20, 49, 1)
+            oled.blit(label_motor_off, 20, 49)
 
 def draw_status_bar(): # display stuff at the top of the oled screen
     oled.fill_rect(0, 0, 128, 15, 0)
     battery_percentage = measure_battery()
     select_battery_icon = get_battery_icon(battery_percentage)
     battery.text(select_battery_icon, 108, -1)
-    # DEBUG mode shows sensor output
-    if mode_debug and not mode_manual:
-        brightness = round(measure_brightness())
-        write12.text(str(brightness) + "%", 15, 0)
+    # DEBUG mode shows sensor output from the last poll, pinging again would block the event loop for another 120ms
+    if mode == _MODE_DEBUG:
+        write12.text(str(round(last_brightness)) + "%", 15, 0)
         lightbulb.char('lightbulb', 0, 0)
-        distance = round(measure_distance())
-        write12.text(str(distance) + "cm", 63, 0)
+        write12.text(str(round(last_distance)) + "cm", 63, 0)
         arrows.char('arrows-alt-h', 45, 0)
 
 def draw_toilet(frame=1):
@@ -375,59 +493,83 @@ def test_battery():
         utime.sleep(2)
 
 def measure_brightness():
-    brightness = pin_sfh300_adc.read_u16() * 0.00152590218 # 100%/65535 = 0.00152590218
+    # average a burst of 8 raw ADC readings to smooth out ADC noise, without carrying old readings into the next poll
+    read = pin_sfh300_adc.read_u16
+    total = 0
+    for _ in range(8):
+        total += read()
+    brightness = (total >> 3) * 0.00152590218 # 100%/65535 = 0.00152590218
     return(brightness)
 
+hcsr04_last_ping = 0 # ticks_ms() of the last trigger pulse
+def measure_echo():
+    global hcsr04_last_ping
+    # if the previous echo is still high, the state machine would count it as the start of this one
+    wait_ms = _HCSR04_CYCLE_MS - utime.ticks_diff(utime.ticks_ms(), hcsr04_last_ping)
+    if wait_ms > 0:
+        utime.sleep_ms(wait_ms)
+    hcsr04_last_ping = utime.ticks_ms()
+    # the state machine sends the trigger pulse and counts down from the timeout while the echo is high
+    hcsr04_sm.put(_HCSR04_TIMEOUT_US)
+    timepassed = _HCSR04_TIMEOUT_US - hcsr04_sm.get()
+    if timepassed < 0: # the counter wrapped around, the echo outlasted the timeout
+        return(hcsr04_max_distance)
+    return(timepassed * 0.01715) # (0.0343 cm per us)/2 = 0.01715
+
 def measure_distance():
-    pin_hcsr04_trigger.low()
-    utime.sleep_us(2)
-    pin_hcsr04_trigger.high()
-    utime.sleep_us(5)
-    pin_hcsr04_trigger.low()
-    while pin_hcsr04_echo.value() == 0:
-        signaloff = utime.ticks_us()
-    while pin_hcsr04_echo.value() == 1:
-        signalon = utime.ticks_us()
-    timepassed = utime.ticks_diff(signalon, signaloff)
-    distance = timepassed * 0.01715 # (0.0343 cm per us)/2 = 0.01715
-    #print("The distance from object is ", distance, "cm")
+    # the median of three measurements discards a single spurious reading
+    a = measure_echo()
+    b = measure_echo()
+    c = measure_echo()
+    distance = a + b + c - min(a, b, c) - max(a, b, c)
+    if _DEBUG:
+        print("The distance from object is ", distance, "cm")
     return(distance)
 
 def motor_cleanup():
-    for pin in range(0, len(motor_pins)):
-        motor_pins[pin].low()
+    # wait until the last queued step, including its delay, has been taken
+    while stepper_sm.tx_fifo():
+        utime.sleep_ms(1)
+    machine.mem32[_PIO0_FDEBUG] = _STEPPER_TXSTALL # write 1 to clear, it is set again once the state machine stalls on pull()
+    while not machine.mem32[_PIO0_FDEBUG] & _STEPPER_TXSTALL:
+        utime.sleep_ms(1)
+    # then clear all motor pins with a single injected instruction
+    stepper_sm.exec(motor_off_instr)
+
+@micropython.native
+def feed_steps(steps, step_lut, step_delay):
+    # put() blocks while the FIFO is full, so the state machine paces the loop
+    put = stepper_sm.put
+    cancel = motor_cancel
+    i = 0
+    motor_step_counter = 0
+    for i in range(steps):
+        put(step_lut[motor_step_counter] | step_delay)
+        motor_step_counter = (motor_step_counter + 1) & 3
+        if cancel[0]:
+            break
+    return i
 
 def motor_spin(revolutions=1, step_sleep=step_sleep_retract):
     gc.collect()
-    global action_in_progress, motor_cancel, motor_retract_revolutions
-    motor_cancel = False
+    global action_in_progress, motor_retract_revolutions
+    motor_cancel[0] = 0
     motor_retract_revolutions = 0
-    i = 0
-    motor_step_counter = 0
+    step_delay = (round(step_sleep * 1000000) - _STEPPER_OVERHEAD_US) << 5
     motor_cleanup()
-    for i in range(revolutions*steps_per_revolution):
-        for pin in range(0, len(motor_pins)):
-            motor_pins[pin].value(step_sequence[motor_step_counter][pin])
-        if motor_direction==True:
-            motor_step_counter = (motor_step_counter - 1) % 4
-        elif motor_direction==False:
-            motor_step_counter = (motor_step_counter + 1) % 4
-        if motor_cancel:
-            #irq_state = machine.disable_irq()
-            break
-        utime.sleep(step_sleep)
+    i = feed_steps(int(revolutions*_STEPS_PER_REVOLUTION), step_lut_cw if motor_direction else step_lut_ccw, step_delay)
     motor_cleanup()
     # If action is ongoing when switching into DEBUG mode, rotating the encoder cancels the action
-    if mode_debug and motor_cancel and rotary_counter != 0:
+    if mode == _MODE_DEBUG and motor_cancel[0] and rotary_counter != 0:
         motor_retract_revolutions = 0
     elif motor_direction == False:
-        motor_retract_revolutions = i/steps_per_revolution
+        motor_retract_revolutions = i/_STEPS_PER_REVOLUTION
     elif motor_direction == True:
-        motor_retract_revolutions = revolutions - i/steps_per_revolution
+        motor_retract_revolutions = revolutions - i/_STEPS_PER_REVOLUTION
     if motor_retract_revolutions < 0.001: # 16 bit machine epsilon rounding produces 4.88e-04
         motor_retract_revolutions = 0
-    if motor_cancel:
-        motor_cancel = False
+    if motor_cancel[0]:
+        motor_cancel[0] = 0
         #machine.enable_irq(irq_state)
     action_in_progress = False
     #_thread.exit()
@@ -436,226 +578,215 @@ def motor_spin_debug(step_sleep=step_sleep_retract):
     gc.collect()
     global action_in_progress
     motor_step_counter = 0
+    step_delay = (round(step_sleep * 1000000) - _STEPPER_OVERHEAD_US) << 5
+    step_lut = step_lut_cw if motor_direction else step_lut_ccw
     motor_cleanup()
-    while abs(rotary_counter * micropython.const(2 * math.pi / 20)) > deadzone:
-        for pin in range(0, len(motor_pins)):
-            motor_pins[pin].value(step_sequence[motor_step_counter][pin])
-        if motor_direction==True:
-            motor_step_counter = (motor_step_counter - 1) % 4
-        elif motor_direction==False:
-            motor_step_counter = (motor_step_counter + 1) % 4
-        utime.sleep(step_sleep)
+    while abs(rotary_counter * rotary_step_angle) > deadzone:
+        stepper_sm.put(step_lut[motor_step_counter] | step_delay)
+        motor_step_counter = (motor_step_counter + 1) & 3
     motor_cleanup()
     action_in_progress = False
     #_thread.exit()
 
-def main():
-    global action_in_progress, motor_cancel, mode_debug, mode_manual, mode_switch, motor_direction, motor_retract_revolutions, rotary_counter
-    while True:
+async def idle_sleep(seconds):
+    # lightsleep halts both cores and the PIO, so only use it while the motor is idle
+    # it also stops the clock to the GPIO edge detector, so a button push is only seen if the button is still held at wake
+    if action_in_progress:
+        await uasyncio.sleep(seconds)
+        return
+    machine.lightsleep(int(seconds * 1000))
+    await uasyncio.sleep(0) # let main() handle a button push from just before or after the sleep
 
-        # AUTO mode
-        if not mode_debug and not mode_manual:
-            # initialise
-            motor_retract_revolutions = 0
-            motor_cleanup()
-            clear_screen()
+async def auto_task():
+    global action_in_progress, motor_direction, motor_retract_revolutions
+    while True:
+        # initialise
+        motor_retract_revolutions = 0
+        motor_cleanup()
+        clear_screen()
+        presence_detected = detect_presence()
+        while presence_detected or action_in_progress:
+            # revert motor if action is ongoing and presence is detected
+            if action_in_progress:
+                motor_cancel[0] = 1 # cancel the ongoing motor thread
+                await uasyncio.sleep(0.1)
+                motor_direction = True
+                action_in_progress = True
+                _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
+                oled.fill_rect(0, 48, 75, 64, 0)
+                oled.fill_rect(10, 48, 60, 16, 1)
+                oled.blit(label_retracting, 18, 49)
+                while action_in_progress:
+                    for i in 1,2,3:
+                        draw_status_bar()
+                        draw_toilet(i)
+                        oled.show()
+                        await uasyncio.sleep(1)
+            # Presence is detected, show the welcome screen
+            oled.fill(0)
+            oled.blit(label_welcome_to, 0, 20)
+            oled.blit(label_the_restroom, 0, 45)
+            draw_status_bar()
+            oled.show()
+            await uasyncio.sleep(_POLLING_INTERVAL_PRESENCE) # stay awake while someone is around to push the button
             presence_detected = detect_presence()
-            while presence_detected or action_in_progress:
-                # switch modes if button has been pushed
-                if mode_switch:
-                    clear_screen()
-                    mode_switch = False
-                    break
-                # revert motor if action is ongoing and presence is detected
-                if action_in_progress:
-                    motor_cancel = True # cancel the ongoing motor thread
-                    utime.sleep(0.1)
-                    motor_direction = True
+            time_since_presence = 0
+            # Presence is no longer detected
+            while not presence_detected and not action_in_progress:
+                # After specified time of not detecting presence, close the lid
+                if time_since_presence >= _ACTION_AFTER_SECONDS and not action_in_progress:
                     action_in_progress = True
-                    _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
-                    oled.fill_rect(0, 48, 75, 64, 0)
+                    motor_direction = False
+                    _thread.start_new_thread(motor_spin, (_ACTION_REVOLUTIONS, step_sleep_close))
+                    # wait for closing to finish, then retract motor
+                    oled.fill(0)
                     oled.fill_rect(10, 48, 60, 16, 1)
-                    write12.text("Retracting", 18, 49, bgcolor=1, color=0)
-                    while action_in_progress and not mode_switch:
+                    oled.blit(label_extending, 20, 49)
+                    presence_detected = detect_presence()
+                    while action_in_progress and not presence_detected:
                         for i in 1,2,3:
-                            draw_status_bar()
                             draw_toilet(i)
                             oled.show()
-                            utime.sleep(1)
-                            if mode_switch: break
-                # Presence is detected, show the welcome screen
-                oled.fill(0)
-                write20.text("Welcome to", 0, 20)
-                write20.text("the restroom", 0, 45)
-                draw_status_bar()
-                oled.show()
-                utime.sleep(polling_interval_presence)
-                presence_detected = detect_presence()
-                time_since_presence = 0
-                # Presence is no longer detected
-                while not presence_detected and not action_in_progress and not mode_switch:
-                    # After specified time of not detecting presence, close the lid
-                    if time_since_presence >= action_after_seconds and not action_in_progress:
+                            await uasyncio.sleep(1)
+                            presence_detected = detect_presence()
+                            if presence_detected: break
+                    # Exit loop if presence has been detected during close action
+                    if presence_detected:
+                        time_since_presence = 0
+                        break
+                    # closing has finished, now retract
+                    if not action_in_progress and not presence_detected:
                         action_in_progress = True
-                        motor_direction = False
-                        _thread.start_new_thread(motor_spin, (action_revolutions, step_sleep_close))
-                        # wait for closing to finish, then retract motor
-                        oled.fill(0)
+                        motor_direction = True
+                        _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
+                        oled.fill_rect(0, 48, 75, 64, 0)
                         oled.fill_rect(10, 48, 60, 16, 1)
-                        write12.text("Extending", 20, 49, bgcolor=1, color=0)
-                        presence_detected = detect_presence()
-                        while action_in_progress and not presence_detected and not mode_switch:
+                        oled.blit(label_retracting, 18, 49)
+                        while action_in_progress and not presence_detected:
                             for i in 1,2,3:
                                 draw_toilet(i)
                                 oled.show()
-                                utime.sleep(1)
+                                await uasyncio.sleep(1)
                                 presence_detected = detect_presence()
-                                if presence_detected or mode_switch: break
-                        # Exit loop if presence has been detected during close action
-                        if presence_detected:
-                            time_since_presence = 0
-                            break
-                        # closing has finished, now retract
-                        if not action_in_progress and not presence_detected and not mode_switch:
-                            action_in_progress = True
-                            motor_direction = True
-                            _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
-                            oled.fill_rect(0, 48, 75, 64, 0)
-                            oled.fill_rect(10, 48, 60, 16, 1)
-                            write12.text("Retracting", 18, 49, bgcolor=1, color=0)
-                            while action_in_progress and not presence_detected and not mode_switch:
-                                for i in 1,2,3:
-                                    draw_toilet(i)
-                                    oled.show()
-                                    utime.sleep(1)
-                                    presence_detected = detect_presence()
-                                    if presence_detected or mode_switch: break
-                        break
-                    draw_status_bar()
-                    #utime.sleep(polling_interval_presence)
-                    machine.lightsleep(micropython.const(polling_interval_presence*1000))
-                    time_since_presence += polling_interval_presence
-                    presence_detected = detect_presence()
-            if not presence_detected and not mode_switch:
-                #utime.sleep(polling_interval_standby)
-                machine.lightsleep(micropython.const(polling_interval_standby*1000))
-
-        # MANUAL mode
-        if not mode_debug and mode_manual:
-            # initialise
-            motor_cleanup()
-            oled.fill(0)
-            draw_status_bar()
-            write15.text("MANUAL mode", 0, 25)
-            while True:
-                # switch modes if button has been pushed
-                if mode_switch:
-                    clear_screen()
-                    mode_switch = False
+                                if presence_detected: break
                     break
-                # if interrupt occured while AUTO mode action was ongoing, revert motor, then switch back to AUTO mode
-                if motor_retract_revolutions > 0:
-                    action_in_progress = True
-                    motor_direction = True
-                    _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
-                    oled.fill_rect(0, 48, 75, 64, 0)
-                    oled.fill_rect(10, 48, 60, 16, 1)
-                    write12.text("Retracting", 18, 49, bgcolor=1, color=0)
-                    while action_in_progress and not mode_switch:
-                        for i in 1,2,3:
-                            draw_status_bar()
-                            draw_toilet(i)
-                            oled.show()
-                            utime.sleep(1)
-                            if mode_switch: break
-                    mode_manual = False
-                    # revert to AUTO mode
-                    break
-                # Close the lid
+                draw_status_bar()
+                await idle_sleep(_POLLING_INTERVAL_PRESENCE)
+                time_since_presence += _POLLING_INTERVAL_PRESENCE
+                presence_detected = detect_presence()
+        if not presence_detected:
+            await idle_sleep(_POLLING_INTERVAL_STANDBY)
+
+async def manual_task():
+    global action_in_progress, mode, motor_direction
+    # initialise
+    motor_cleanup()
+    oled.fill(0)
+    draw_status_bar()
+    oled.blit(label_manual_mode, 0, 25)
+    # if interrupt occured while AUTO mode action was ongoing, revert motor, then switch back to AUTO mode
+    if motor_retract_revolutions > 0:
+        action_in_progress = True
+        motor_direction = True
+        _thread.start_new_thread(motor_spin, (motor_retract_revolutions, step_sleep_retract))
+        oled.fill_rect(0, 48, 75, 64, 0)
+        oled.fill_rect(10, 48, 60, 16, 1)
+        oled.blit(label_retracting, 18, 49)
+        while action_in_progress:
+            for i in 1,2,3:
+                draw_status_bar()
+                draw_toilet(i)
+                oled.show()
+                await uasyncio.sleep(1)
+    else:
+        # Close the lid
+        action_in_progress = True
+        motor_direction = False
+        _thread.start_new_thread(motor_spin, (_ACTION_REVOLUTIONS, step_sleep_close))
+        oled.fill_rect(0, 48, 75, 64, 0)
+        oled.fill_rect(10, 48, 60, 16, 1)
+        oled.blit(label_extending, 20, 49)
+        while action_in_progress:
+            for i in 1,2,3:
+                draw_toilet(i)
+                oled.show()
+                await uasyncio.sleep(1)
+        # closing has finished, now retract
+        action_in_progress = True
+        motor_direction = True
+        _thread.start_new_thread(motor_spin, (_ACTION_REVOLUTIONS, step_sleep_retract))
+        oled.fill_rect(0, 48, 75, 64, 0)
+        oled.fill_rect(10, 48, 60, 16, 1)
+        oled.blit(label_retracting, 18, 49)
+        while action_in_progress:
+            for i in 1,2,3:
+                draw_toilet(i)
+                oled.show()
+                await uasyncio.sleep(1)
+    # revert to AUTO mode
+    mode = _MODE_AUTO
+    mode_switch_flag.set()
+
+async def debug_task():
+    global action_in_progress, mode, motor_direction, motor_retract_revolutions, rotary_counter, rotary_encoder_drawn
+    # initialise
+    motor_cleanup()
+    rotary_counter = 0
+    oled.fill(0)
+    rotary_encoder_drawn = None
+    oled.blit(label_debug_mode, 0, 25)
+    oled.show()
+    try:
+        while True:
+            # revert motor if ongoing MANUAL action has been cancelled by switching to DEBUG
+            while motor_retract_revolutions > 0 and action_in_progress:
+                await uasyncio.sleep(0.01)
+            if motor_retract_revolutions > 0 and not action_in_progress:
+                rotary_counter = 0
+                motor_direction = True
                 action_in_progress = True
+                _thread.start_new_thread(motor_spin, (motor_retract_revolutions,))
+                motor_retract_revolutions = 0
+            # rotate motor if rotary encoder has been turned beyond the deadzone
+            rotary_angle = rotary_counter * rotary_step_angle
+            if rotary_angle > deadzone and not action_in_progress:
                 motor_direction = False
-                _thread.start_new_thread(motor_spin, (action_revolutions, step_sleep_close))
-                oled.fill_rect(0, 48, 75, 64, 0)
-                oled.fill_rect(10, 48, 60, 16, 1)
-                write12.text("Extending", 20, 49, bgcolor=1, color=0)
-                while action_in_progress and not mode_switch:
-                    for i in 1,2,3:
-                        draw_toilet(i)
-                        oled.show()
-                        utime.sleep(1)
-                        if mode_switch: break
-                # closing has finished, now retract
-                if not action_in_progress and not mode_switch:
-                    action_in_progress = True
-                    motor_direction = True
-                    _thread.start_new_thread(motor_spin, (action_revolutions, step_sleep_retract))
-                oled.fill_rect(0, 48, 75, 64, 0)
-                oled.fill_rect(10, 48, 60, 16, 1)
-                write12.text("Retracting", 18, 49, bgcolor=1, color=0)
-                while action_in_progress and not mode_switch:
-                    for i in 1,2,3:
-                        draw_toilet(i)
-                        oled.show()
-                        utime.sleep(1)
-                        if mode_switch: break
-                mode_manual = False
-                break
-
-        # DEBUG mode
-        if mode_debug and not mode_manual:
-            # initialise
-            motor_cleanup()
-            rotary_counter = 0
-            oled.fill(0)
-            write15.text("DEBUG mode", 0, 25)
+                action_in_progress = True
+                _thread.start_new_thread(motor_spin_debug, (step_sleep_close,))
+            elif rotary_angle < -deadzone and not action_in_progress:
+                motor_direction = True
+                action_in_progress = True
+                _thread.start_new_thread(motor_spin_debug, (step_sleep_retract,))
+            draw_status_bar()
+            draw_rotary_encoder(rotary_counter)
             oled.show()
-            while True:
-                # switch modes if button has been pushed
-                if mode_switch:
-                    clear_screen()
-                    mode_switch = False
-                    if action_in_progress: rotary_counter = 0 # stop ongoing motor_spin_debug action 
-                    break
-                # revert motor if ongoing MANUAL action has been cancelled by switching to DEBUG
-                while motor_retract_revolutions > 0 and action_in_progress:
-                    utime.sleep(0.01)
-                if motor_retract_revolutions > 0 and not action_in_progress:
-                    rotary_counter = 0
-                    motor_direction = True
-                    action_in_progress = True
-                    _thread.start_new_thread(motor_spin, (motor_retract_revolutions,))
-                    motor_retract_revolutions = 0
-                # rotate motor if rotary encoder has been turned beyond the deadzone
-                rotary_angle = rotary_counter * micropython.const(2 * math.pi / 20)
-                if rotary_angle > deadzone and not action_in_progress:
-                    motor_direction = False
-                    action_in_progress = True
-                    _thread.start_new_thread(motor_spin_debug, (step_sleep_close,))
-                elif rotary_angle < -deadzone and not action_in_progress:
-                    motor_direction = True
-                    action_in_progress = True
-                    _thread.start_new_thread(motor_spin_debug, (step_sleep_retract,))
+            await uasyncio.sleep(polling_interval_debug)
+            presence_detected = detect_presence()
+            time_since_presence = 0
+            # after specified time of not detecting presence, revert to AUTO mode
+            while not presence_detected and not abs(rotary_angle) > deadzone:
+                rotary_angle = rotary_counter * rotary_step_angle
                 draw_status_bar()
                 draw_rotary_encoder(rotary_counter)
                 oled.show()
-                utime.sleep(polling_interval_debug)
+                if time_since_presence >= _ACTION_AFTER_SECONDS:
+                    mode = _MODE_AUTO
+                    mode_switch_flag.set()
+                    return
+                await uasyncio.sleep(polling_interval_debug)
+                time_since_presence += polling_interval_debug
                 presence_detected = detect_presence()
-                time_since_presence = 0
-                # after specified time of not detecting presence, revert to AUTO mode
-                while not presence_detected and not abs(rotary_angle) > deadzone:
-                    rotary_angle = rotary_counter * micropython.const(2 * math.pi / 20)
-                    draw_status_bar()
-                    draw_rotary_encoder(rotary_counter)
-                    oled.show()
-                    if mode_switch:
-                        break
-                    if time_since_presence >= action_after_seconds:
-                        mode_debug = False
-                        mode_switch = True
-                        break
-                    utime.sleep(polling_interval_debug)
-                    time_since_presence += polling_interval_debug
-                    presence_detected = detect_presence()
+    finally:
+        if action_in_progress: rotary_counter = 0 # stop ongoing motor_spin_debug action
+
+async def main():
+    mode_tasks = (auto_task, manual_task, debug_task) # indexed by mode
+    while True:
+        task = uasyncio.create_task(mode_tasks[mode]())
+        # the button (or the task itself) switches modes, cancel the task and start the next one
+        await mode_switch_flag.wait() # wait() also clears the flag
+        task.cancel()
+        clear_screen()
 
 ########################
 #   Setup interrupts   #
@@ -667,4 +798,4 @@ pin_ky040_sw.irq(trigger=Pin.IRQ_RISING, handler=button_interrupt, hard=True) #
 ###############
 #   Execute   #
 ###############
-main()
\ No newline at end of file
+uasyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,9 @@
+# Freeze main.py into the firmware as bytecode, so it runs from flash instead of being compiled into RAM at boot.
+# Build from the micropython repository with:
+# make -C ports/rp2 BOARD=PICO FROZEN_MANIFEST=/path/to/ToiletSeatCloser/MicroPython/manifest.py
+# At boot, frozen modules are looked up before the filesystem, so a frozen main.py always runs and a main.py copied to the Pico is ignored.
+# Calibrate with main.py on the filesystem of a stock firmware first, every change to the frozen copy needs a rebuild (see the README).
+# The ssd1306 and oled packages (see main.py) stay installed on the filesystem as before.
+include("$(PORT_DIR)/boards/manifest.py")
+# opt=2 is the same as mpy-cross -O2: strips line numbers and assert statements
+freeze(".", "main.py", opt=2)